@@ -9,8 +9,12 @@ import calendar as pycal
 # ===============================
 import time                  # 用來暫停，讓你看到瀏覽器畫面
 import requests              # 呼叫 TWSE 官方 API
-import pymssql               # 連線 SQL Server
+import numpy as np           # stock_data 批次是 numpy 欄位陣列
 from bs4 import BeautifulSoup  # 解析股票清單 HTML
+from stock_storage import open_storage, BULK_BATCH_SIZE  # 資料庫（SQL Server / SQLite / DuckDB）
+from stock_validation import (                           # stock_data 整批驗證規則
+    STOCK_FIELDS, parse_stock_rows, validate_stock_batch, describe_reasons, take_batch
+)
 
 # ===============================
 # selenium：只用來「顯示流程」
@@ -20,18 +24,6 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 
 
-# ===============================
-# 建立資料庫連線
-# ===============================
-def get_db_conn():
-    return pymssql.connect(
-        server="127.0.0.1",
-        user="skyfire",
-        password="1487",
-        database="ncu_db"
-    )
-
-
 # ===============================
 # 安全解析 TWSE 日期字串
 # ===============================
@@ -144,16 +136,8 @@ def crawl_calendar(target_year):
 
     print(f"[CALENDAR] 假日 {len(holiday_dict)} 筆")
 
-    # 寫入資料庫
-    conn = get_db_conn()
-    cursor = conn.cursor()
-
-    # 先清掉舊資料，避免重複
-    cursor.execute("DELETE FROM calendar WHERE YEAR(date)=%s", (target_year,))
-    cursor.execute("DELETE FROM year_calendar WHERE year=%s", (target_year,))
-    conn.commit()
-
     work_day = 0
+    days = []
 
     # 跑完整年每一天
     for m in range(1, 13):
@@ -195,20 +179,13 @@ def crawl_calendar(target_year):
 
 
 
-            # 寫入 calendar
-            cursor.execute(
-                "INSERT INTO calendar (date, day_of_stock, other) VALUES (%s,%s,%s)",
-                (dt, day_of_stock, other)
-            )
-
-    # 寫入 year_calendar
-    cursor.execute(
-        "INSERT INTO year_calendar (year, total_day) VALUES (%s,%s)",
-        (target_year, work_day)
-    )
+            days.append((dt, day_of_stock, other))
 
-    conn.commit()
-    conn.close()
+    # 寫入 calendar / year_calendar（整年覆蓋，避免重複）
+    storage = open_storage()
+    storage.replace_calendar(target_year, days, work_day)
+    storage.commit()
+    storage.close()
 
     print(f"[CALENDAR] 完成，交易日={work_day}")
 
@@ -234,8 +211,7 @@ def crawl_stock_list():
     res = requests.get("https://isin.twse.com.tw/isin/C_public.jsp?strMode=2")
     soup = BeautifulSoup(res.text, "html.parser")
 
-    conn = get_db_conn()
-    cursor = conn.cursor()
+    storage = open_storage()
 
     count = 0
 
@@ -246,21 +222,12 @@ def crawl_stock_list():
             code, name = tds[0].text.strip().split("　", 1)
             category = tds[4].text.strip()
 
-            cursor.execute("""
-                IF NOT EXISTS (SELECT 1 FROM stock_list WHERE stock_code=%s)
-                BEGIN
-                    INSERT INTO stock_list
-                    (stock_code, name, type, category, isTaiwan50)
-                    VALUES (%s,%s,%s,%s,0)
-                END
-            """, (code, code, name, "上市", category))
-
-            # 正確計數：檢查是否有插入
-            if cursor.rowcount > 0:
+            # 正確計數：只算真的有插入的
+            if storage.insert_stock_if_absent(code, name, "上市", category):
                 count += 1
 
-    conn.commit()
-    conn.close()
+    storage.commit()
+    storage.close()
 
     print(f"[STOCK_LIST] 新增 {count} 筆")
 
@@ -268,6 +235,126 @@ def crawl_stock_list():
     driver.quit()
 
 
+# ===============================
+# 確認 calendar 涵蓋整個區間
+#   calendar 缺日子的話 NON_TRADING 永遠不會觸發，壞資料會被當成乾淨的
+# ===============================
+def check_calendar_coverage(storage, start, end):
+    expected = (end - start).days + 1
+    covered = storage.count_calendar_days(start, end)
+    if covered < expected:
+        print(f"[WARNING] calendar 在 {start}~{end} 只有 {covered}/{expected} 天，"
+              f"請先跑 crawl_calendar 建好這幾年")
+        return False
+    return True
+
+
+# ===============================
+# 取出 calendar 中的非交易日
+# ===============================
+def load_non_trading_days(storage, start, end):
+    return np.array(storage.load_non_trading_days(start, end), dtype="datetime64[D]")
+
+
+# ===============================
+# 批次 → stock_data 的 tuple（欄位順序見 stock_storage.STOCK_COLUMNS）
+# ===============================
+def iter_stock_data_rows(stock_code, batch):
+    for dt, tv, t, o, h, l, c, d, v in zip(
+        batch["date"].astype(object),
+        *(batch[k] for k in STOCK_FIELDS)
+    ):
+        yield (
+            stock_code, dt, None,
+            int(tv), int(t),
+            float(o), float(h), float(l), float(c), float(d),
+            int(v)
+        )
+
+
+# ===============================
+# 批次 → 隔離區的 tuple（原始字串原封不動保留，方便事後追查）
+# ===============================
+def quarantine_rows(stock_code, batch, reasons):
+    return [
+        (
+            stock_code,
+            None if np.isnat(dt) else dt.astype(object),
+            "|".join(str(x) for x in raw),
+            int(code),
+            describe_reasons(code)
+        )
+        for dt, raw, code in zip(batch["date"], batch["raw"], reasons)
+    ]
+
+
+# ===============================
+# 驗證 + 分流：回傳（乾淨子批次, 隔離區 tuple）
+# ===============================
+def split_stock_batch(stock_code, batch, non_trading_days):
+    reasons = validate_stock_batch(batch, non_trading_days)
+    clean = reasons == 0
+
+    return (
+        take_batch(batch, clean),
+        quarantine_rows(stock_code, take_batch(batch, ~clean), reasons[~clean])
+    )
+
+
+# ===============================
+# 一般寫入：乾淨的進 stock_data，壞的進隔離區
+# ===============================
+def ingest_stock_rows(storage, stock_code, rows):
+    batch = parse_stock_rows(rows)
+
+    # 只查這批資料涵蓋的日期區間
+    valid_dates = batch["date"][~np.isnat(batch["date"])]
+    if len(valid_dates):
+        start, end = valid_dates.min().astype(object), valid_dates.max().astype(object)
+        # 單月寫入只提醒，不擋
+        check_calendar_coverage(storage, start, end)
+        non_trading = load_non_trading_days(storage, start, end)
+    else:
+        non_trading = np.array([], dtype="datetime64[D]")
+
+    clean, bad = split_stock_batch(stock_code, batch, non_trading)
+
+    inserted = storage.write_stock_data(iter_stock_data_rows(stock_code, clean))
+    quarantined = storage.write_quarantine(bad)
+
+    return inserted, quarantined
+
+
+BACKFILL_SLEEP = 3        # 兩次 TWSE 請求之間暫停秒數（避免被擋）
+FETCH_RETRIES  = 3        # 單次請求失敗時重試幾次
+
+
+# ===============================
+# 呼叫 TWSE STOCK_DAY（一次回傳一個月）
+#   失敗（逾時、被擋回傳 HTML 頁面）會重試，全部失敗回傳 None
+# ===============================
+def fetch_stock_day(stock_no, query_date):
+    for attempt in range(1, FETCH_RETRIES + 1):
+        try:
+            res = requests.get(
+                "https://www.twse.com.tw/exchangeReport/STOCK_DAY",
+                params={
+                    "response": "json",
+                    "date": query_date,
+                    "stockNo": stock_no
+                },
+                timeout=30
+            )
+            res.raise_for_status()
+            return res.json()
+        except (requests.RequestException, ValueError) as e:
+            # ValueError：被擋的時候回傳的是 HTML，.json() 解析失敗
+            print(f"[WARNING] STOCK_DAY {stock_no} {query_date} 第 {attempt} 次失敗：{e}")
+            time.sleep(BACKFILL_SLEEP * attempt)
+
+    return None
+
+
 # ===============================
 # STEP 3：建立 stock_data（2330 日資料）
 # ===============================
@@ -283,56 +370,91 @@ def crawl_stock_data():
 
     # 呼叫股價 API
     print("[STOCK_DATA] 呼叫 TWSE API")
-    res = requests.get(
-        "https://www.twse.com.tw/exchangeReport/STOCK_DAY",
-        params={
-            "response": "json",
-            "date": "20260101",
-            "stockNo": "2330"
-        },
-        timeout=30
-    ).json()
+    res = fetch_stock_day("2330", "20260101") or {}
 
-    conn = get_db_conn()
-    cursor = conn.cursor()
+    storage = open_storage()
 
-    # 寫入每日股價
-    for r in res.get("data", []):
-        y, m, d = r[0].split("/")
-        trade_date = date(int(y) + 1911, int(m), int(d))
+    # 整批驗證後寫入：壞資料進 stock_data_quarantine
+    inserted, quarantined = ingest_stock_rows(storage, "2330", res.get("data", []))
 
-        cursor.execute("""
-        IF NOT EXISTS (
-            SELECT 1 FROM stock_data
-            WHERE stock_code='2330' AND date=%s AND time IS NULL
-        )
-        INSERT INTO stock_data
-        (stock_code, date, time, tv, t, o, h, l, c, d, v)
-        VALUES
-        ('2330', %s, NULL, %s,%s,%s,%s,%s,%s,%s,%s)
-        """, (
-        trade_date,                              # WHERE date=%s
-        trade_date,                              # VALUES %s (date)
-        int(r[1].replace(",", "")),              # tv
-        int(r[2].replace(",", "")),              # t
-        float(r[3].replace(",", "")),            # o ← 改這裡
-        float(r[4].replace(",", "")),            # h ← 改這裡
-        float(r[5].replace(",", "")),            # l ← 改這裡
-        float(r[6].replace(",", "")),            # c ← 改這裡
-        float(r[7].replace(",", "")),            # d ← 改這裡
-        int(r[8].replace(",", ""))               # v
-        ))
-
-
-    conn.commit()
-    conn.close()
-
-    print("[STOCK_DATA] 完成")
+    storage.commit()
+    storage.close()
+
+    print(f"[STOCK_DATA] 完成，寫入 {inserted} 筆，隔離 {quarantined} 筆")
 
     time.sleep(5)
     driver.quit()
 
 
+# ===============================
+# STEP 4：大量回補 stock_data（bulk copy）
+# ===============================
+def backfill_stock_data(stock_codes, start_year, end_year,
+                        batch_size=BULK_BATCH_SIZE, minimal_logging=False):
+    print(f"\n[STEP 4] 回補 stock_data（{len(stock_codes)} 檔，{start_year}~{end_year}）")
+
+    storage = open_storage()
+
+    # calendar 沒建好就不回補，否則整段都不會檢查非交易日
+    if not check_calendar_coverage(storage, date(start_year, 1, 1), date(end_year, 12, 31)):
+        print("[BACKFILL] 中止：calendar 不完整")
+        storage.close()
+        return None
+
+    # 整段區間的非交易日先一次查好
+    non_trading = load_non_trading_days(
+        storage, date(start_year, 1, 1), date(end_year, 12, 31)
+    )
+
+    pending = []              # 還沒寫入的乾淨列（最多約 batch_size 筆）
+    bad_rows = []             # 還沒寫入的隔離列
+    failed = []               # 重試後仍抓不到的月份
+    merged = 0
+    quarantined = 0
+
+    # 分段寫入：每段 bulk copy → 合併 → 寫隔離區 → commit
+    # 中途出錯只會損失還沒寫入的這一段，已 commit 的不受影響
+    def flush():
+        nonlocal merged, quarantined
+        if pending:
+            merged += storage.bulk_load_stock_data(pending, batch_size, minimal_logging)
+        quarantined += storage.write_quarantine(bad_rows)
+        storage.commit()
+        pending.clear()
+        bad_rows.clear()
+
+    try:
+        for code in stock_codes:
+            for y in range(start_year, end_year + 1):
+                for m in range(1, 13):
+                    res = fetch_stock_day(code, f"{y}{m:02d}01")
+                    time.sleep(BACKFILL_SLEEP)
+
+                    # 抓不到就跳過這個月，不要讓整個回補中止
+                    if res is None:
+                        failed.append(f"{code} {y}-{m:02d}")
+                        continue
+
+                    batch = parse_stock_rows(res.get("data", []))
+                    clean, bad = split_stock_batch(code, batch, non_trading)
+                    pending.extend(iter_stock_data_rows(code, clean))
+                    bad_rows.extend(bad)
+
+                    if len(pending) >= batch_size:
+                        flush()
+
+            # 每檔股票結束也寫一次，重跑時進度不會差太多
+            flush()
+    finally:
+        storage.close()
+
+    if failed:
+        print(f"[BACKFILL] 以下 {len(failed)} 個月抓取失敗，請之後補抓：{', '.join(failed)}")
+    print(f"[BACKFILL] 完成，新增 {merged} 筆，隔離 {quarantined} 筆")
+
+    return merged, quarantined, failed
+
+
 # ===============================
 # 主程式（控制是否重跑）
 # ===============================
@@ -340,6 +462,7 @@ if __name__ == "__main__":
     RUN_CALENDAR   = True
     RUN_STOCK_LIST = False
     RUN_STOCK_DATA = False
+    RUN_BACKFILL   = False
 
     if RUN_CALENDAR:
         crawl_calendar(2026)
@@ -350,4 +473,10 @@ if __name__ == "__main__":
     if RUN_STOCK_DATA:
         crawl_stock_data()
 
+    if RUN_BACKFILL:
+        # 回補年份的 calendar 要先建好，否則 backfill_stock_data 會中止
+        for y in range(2016, 2026):
+            crawl_calendar(y)
+        backfill_stock_data(["2330"], 2016, 2025, minimal_logging=True)
+
     print("\n=== 全部流程完成，可直接截圖驗收 ===")
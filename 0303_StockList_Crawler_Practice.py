@@ -2,7 +2,7 @@
 # 1) 匯入：正則/DB/HTTP/HTML解析/瀏覽器自動化
 # ===============================
 import re                          # 正則：用來從文字中「抓出4位數股票代碼」
-import pymssql                     # 連線 SQL Server（把爬到的資料寫入資料庫）
+from stock_storage import open_storage  # 資料庫（SQL Server / SQLite / DuckDB，把爬到的資料寫入）
 import requests                    # 發HTTP請求：下載網頁HTML（ISIN股票清單頁）
 from bs4 import BeautifulSoup      # 解析HTML：把HTML變成可用CSS selector找資料的物件
 
@@ -23,15 +23,8 @@ from webdriver_manager.chrome import ChromeDriverManager
 
 
 # ===============================
-# 2) SQL Server連線設定（對應你本機SQL帳密）
+# 2) 資料庫連線設定：見 stock_storage.py（MSSQL_SETTINGS / 環境變數 STOCK_DB）
 # ===============================
-db_settings = {
-    "host": "127.0.0.1",      # 本機
-    "user": "skyfire",        # SQL帳號
-    "password": "1487",       # SQL密碼
-    "database": "ncu_db",     # 使用的資料庫
-    "charset": "utf8"
-}
 
 # ===============================
 # 3) taiwan50：存「0050前10大成分股」的股票代碼
@@ -140,7 +133,7 @@ def find_Taiwan50():
 
 def find_stock(url, start, end, stock_type):
     """
-    STEP 2：抓「上市/上櫃」股票清單，寫入 dbo.stock_list
+    STEP 2：抓「上市/上櫃」股票清單，寫入 stock_list
     這裡用 requests+BeautifulSoup（因為ISIN頁面是靜態HTML，不需要selenium）
     """
     print(f"\n[STEP 2] 開始爬取{stock_type}股票清單...")
@@ -148,107 +141,78 @@ def find_stock(url, start, end, stock_type):
 
     try:
         # ---------- 連線資料庫 ----------
-        conn = pymssql.connect(**db_settings)
+        storage = open_storage()
         print("[DEBUG] 資料庫連線成功")
 
-        with conn.cursor() as cursor:
-            # 先查是否存在（避免重複、也方便更新標記）
-            check_command = "SELECT COUNT(*) FROM dbo.stock_list WHERE stock_code = %s"
-
-            # 不存在：新增
-            insert_command = """
-            INSERT INTO dbo.stock_list (stock_code, name, type, category, isTaiwan50)
-            VALUES (%s, %s, %s, %s, %s)
-            """
-
-            # 已存在：更新（關鍵！避免你之前“存在就跳過”導致台灣50只剩6）
-            update_command = """
-            UPDATE dbo.stock_list
-            SET name = %s,
-                type = %s,
-                category = %s,
-                isTaiwan50 = %s
-            WHERE stock_code = %s
-            """
-
-            # ---------- 下載ISIN網頁 ----------
-            print("[DEBUG] 正在下載股票清單網頁...")
-            response = requests.get(url, timeout=30)
-            soup = BeautifulSoup(response.text, "html.parser")
-
-            # ---------- 找出“起點/終點”所在的<tr> ----------
-            # Why：這張表很長，裡面有「股票」「特別股」「權證」等段落
-            # How：先找到b標籤中，文字等於start與end的那兩列<tr>
-            print("[DEBUG] 正在解析 HTML...")
-            result = soup.select("table td b")
-            start_td = None
-            end_td = None
-
-            for b in result:
-                if b.text.strip() == start:
-                    start_td = b.find_parent("tr")  # 起點那一列<tr>
-                    print(f"[DEBUG] 找到起點：{start}")
-                elif b.text.strip() == end:
-                    end_td = b.find_parent("tr")    # 終點那一列<tr>
-                    print(f"[DEBUG] 找到終點：{end}")
-
-            if not start_td or not end_td:
-                print("[錯誤] 找不到起點或終點標籤(網站可能改版)")
-                return
-
-            # 從起點的下一列開始走，直到終點之前
-            row = start_td.find_next("tr")
-
-            total_count = 0
-            inserted_count = 0
-            updated_count = 0
-            skipped_count = 0
-
-            while row and row != end_td:
-                tds = row.find_all("td")
-
-                # 這裡的判斷：
-                # - 至少要有5欄（代號名稱、ISIN等欄位）
-                # - 第一欄通常是 "2330　台積電" 這種格式，中間是全形空白"　"
-                if len(tds) >= 5 and "　" in tds[0].text:
-                    stock_id, stock_name = tds[0].text.strip().split("　", 1)
-
-                    # stock_type_value：上市/上櫃頁面中會有類型欄（有時是上市、上櫃、ETF等）
-                    stock_type_value = tds[3].text.strip()
-
-                    # category：產業分類（如半導體業、金融保險業…）
-                    category = tds[4].text.strip()
-
-                    # isTaiwan50：如果這支股票在 taiwan50 set 裡，就標記1
-                    is_taiwan50 = 1 if stock_id in taiwan50 else 0
-
-                    # DB存在檢查
-                    cursor.execute(check_command, (stock_id,))
-                    exists = cursor.fetchone()[0] > 0
-
-                    if exists:
-                        # 已存在：更新（包含isTaiwan50）
-                        cursor.execute(
-                            update_command,
-                            (stock_name, stock_type_value, category, is_taiwan50, stock_id)
-                        )
-                        updated_count += 1
-                    else:
-                        # 不存在：新增
-                        cursor.execute(
-                            insert_command,
-                            (stock_id, stock_name, stock_type_value, category, is_taiwan50)
-                        )
-                        inserted_count += 1
-
-                    total_count += 1
+        # ---------- 下載ISIN網頁 ----------
+        print("[DEBUG] 正在下載股票清單網頁...")
+        response = requests.get(url, timeout=30)
+        soup = BeautifulSoup(response.text, "html.parser")
+
+        # ---------- 找出“起點/終點”所在的<tr> ----------
+        # Why：這張表很長，裡面有「股票」「特別股」「權證」等段落
+        # How：先找到b標籤中，文字等於start與end的那兩列<tr>
+        print("[DEBUG] 正在解析 HTML...")
+        result = soup.select("table td b")
+        start_td = None
+        end_td = None
+
+        for b in result:
+            if b.text.strip() == start:
+                start_td = b.find_parent("tr")  # 起點那一列<tr>
+                print(f"[DEBUG] 找到起點：{start}")
+            elif b.text.strip() == end:
+                end_td = b.find_parent("tr")    # 終點那一列<tr>
+                print(f"[DEBUG] 找到終點：{end}")
+
+        if not start_td or not end_td:
+            print("[錯誤] 找不到起點或終點標籤(網站可能改版)")
+            return
+
+        # 從起點的下一列開始走，直到終點之前
+        row = start_td.find_next("tr")
+
+        total_count = 0
+        inserted_count = 0
+        updated_count = 0
+        skipped_count = 0
+
+        while row and row != end_td:
+            tds = row.find_all("td")
+
+            # 這裡的判斷：
+            # - 至少要有5欄（代號名稱、ISIN等欄位）
+            # - 第一欄通常是 "2330　台積電" 這種格式，中間是全形空白"　"
+            if len(tds) >= 5 and "　" in tds[0].text:
+                stock_id, stock_name = tds[0].text.strip().split("　", 1)
+
+                # stock_type_value：上市/上櫃頁面中會有類型欄（有時是上市、上櫃、ETF等）
+                stock_type_value = tds[3].text.strip()
+
+                # category：產業分類（如半導體業、金融保險業…）
+                category = tds[4].text.strip()
+
+                # isTaiwan50：如果這支股票在 taiwan50 set 裡，就標記1
+                is_taiwan50 = 1 if stock_id in taiwan50 else 0
+
+                # 已存在：更新（關鍵！避免你之前“存在就跳過”導致台灣50只剩6）
+                # 不存在：新增
+                action = storage.upsert_stock(
+                    stock_id, stock_name, stock_type_value, category, is_taiwan50
+                )
+                if action == "update":
+                    updated_count += 1
                 else:
-                    skipped_count += 1
+                    inserted_count += 1
 
-                row = row.find_next("tr")
+                total_count += 1
+            else:
+                skipped_count += 1
 
-            conn.commit()
-            print(f"\n[{stock_type}完成] 總處理 {total_count} 筆 | 新增 {inserted_count} | 更新 {updated_count} | 跳過 {skipped_count}")
+            row = row.find_next("tr")
+
+        storage.commit()
+        print(f"\n[{stock_type}完成] 總處理 {total_count} 筆 | 新增 {inserted_count} | 更新 {updated_count} | 跳過 {skipped_count}")
 
     except Exception as e:
         print(f"[錯誤] {e}")
@@ -256,7 +220,7 @@ def find_stock(url, start, end, stock_type):
         traceback.print_exc()
     finally:
         try:
-            conn.close()
+            storage.close()
             print("[DEBUG] 資料庫連線已關閉")
         except:
             pass
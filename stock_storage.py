@@ -0,0 +1,580 @@
+# ===============================
+# 儲存層：calendar / stock_list / stock_data 的讀寫集中在這裡
+#
+# Why：
+# - 爬蟲腳本原本寫死 pymssql 與 T-SQL（IF NOT EXISTS ... BEGIN ... END、YEAR(date)）
+# - 沒有 SQL Server 的筆電 / 測試環境就整條流程跑不起來
+#
+# How：
+# - StockStorage 定義爬蟲需要的操作
+# - MSSQLStorage：原本的 SQL Server 寫法
+# - SQLiteStorage / DuckDBStorage：內嵌引擎，開一個檔案（或 :memory:）就能跑
+# - open_storage("mssql" / "sqlite:stock.db" / "duckdb:stock.duckdb") 決定用哪個
+# ===============================
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import date, time
+from itertools import islice
+
+
+# ===============================
+# SQL Server 連線設定
+# ===============================
+MSSQL_SETTINGS = {
+    "server": "127.0.0.1",    # 本機
+    "user": "skyfire",        # SQL帳號
+    "password": "1487",       # SQL密碼
+    "database": "ncu_db",     # 使用的資料庫
+    "charset": "utf8"
+}
+
+# 沒指定就用 SQL Server；可用環境變數 STOCK_DB 換掉，例如 STOCK_DB=duckdb:stock.duckdb
+DEFAULT_DB = "mssql"
+
+BULK_BATCH_SIZE = 50000   # 每次大量寫入送出的列數
+
+# stock_data 欄位順序（寫入的 tuple 都照這個順序）
+STOCK_COLUMNS = ("stock_code", "date", "time", "tv", "t", "o", "h", "l", "c", "d", "v")
+
+# 隔離區欄位順序
+QUARANTINE_COLUMNS = ("stock_code", "date", "raw", "reason_code", "reason")
+
+# Python 3.12 起 sqlite3 預設的 date 轉換器已棄用，自己註冊
+# time 本來就沒有預設轉換器，stock_data.time 不是 NULL 時會直接報錯
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(time, time.isoformat)
+
+
+class StockStorage(ABC):
+    """
+    功能：爬蟲會用到的所有資料庫操作
+
+    - 每個方法只負責「一個動作」，方法內部不 commit，一律由呼叫端 commit()
+      （例如 stock_data 與隔離區要在同一個交易內寫入）
+    - 日期參數一律是 datetime.date
+    - 新的 backend 少實作任何一個方法，建立物件時就會直接報錯
+    """
+
+    # ---------- calendar ----------
+    @abstractmethod
+    def replace_calendar(self, year, days, total_day):
+        """days：[(date, day_of_stock, other), ...]，整年覆蓋"""
+
+    @abstractmethod
+    def load_non_trading_days(self, start, end):
+        """回傳 [start, end] 之間 day_of_stock = -1 的日期"""
+
+    @abstractmethod
+    def count_calendar_days(self, start, end):
+        """回傳 calendar 在 [start, end] 之間有幾天（用來確認 calendar 是否建好）"""
+
+    # ---------- stock_list ----------
+    @abstractmethod
+    def insert_stock_if_absent(self, code, name, stock_type, category):
+        """不存在才新增（isTaiwan50=0），回傳是否有新增"""
+
+    @abstractmethod
+    def upsert_stock(self, code, name, stock_type, category, is_taiwan50):
+        """存在就更新、不存在就新增，回傳 "insert" 或 "update" """
+
+    # ---------- stock_data ----------
+    @abstractmethod
+    def write_stock_data(self, rows):
+        """rows：STOCK_COLUMNS 順序的 tuple，已存在的 (stock_code, date, time) 會跳過"""
+
+    @abstractmethod
+    def write_quarantine(self, rows):
+        """rows：QUARANTINE_COLUMNS 順序的 tuple，已隔離過的 (stock_code, date, raw) 會跳過"""
+
+    @abstractmethod
+    def bulk_load_stock_data(self, rows, batch_size=BULK_BATCH_SIZE, minimal_logging=False):
+        """大量回補：rows 可以是 generator，回傳實際新增筆數"""
+
+    # ---------- 連線 ----------
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# ===============================
+# SQL Server（pymssql）
+# ===============================
+class MSSQLStorage(StockStorage):
+    # # 開頭是這條連線專屬的暫存表：平行跑多個回補也不會互相 TRUNCATE 掉對方的資料
+    STAGING_TABLE = "#stock_data_staging"
+
+    def __init__(self, settings=MSSQL_SETTINGS):
+        # 只有真的用 SQL Server 才需要 pymssql
+        import pymssql
+        self.conn = pymssql.connect(**settings)
+        self.cursor = self.conn.cursor()
+
+    def replace_calendar(self, year, days, total_day):
+        # 先清掉舊資料，避免重複
+        self.cursor.execute("DELETE FROM calendar WHERE YEAR(date)=%s", (year,))
+        self.cursor.execute("DELETE FROM year_calendar WHERE year=%s", (year,))
+
+        self.cursor.executemany(
+            "INSERT INTO calendar (date, day_of_stock, other) VALUES (%s,%s,%s)",
+            days
+        )
+        self.cursor.execute(
+            "INSERT INTO year_calendar (year, total_day) VALUES (%s,%s)",
+            (year, total_day)
+        )
+
+    def load_non_trading_days(self, start, end):
+        self.cursor.execute(
+            "SELECT date FROM calendar WHERE day_of_stock = -1 AND date BETWEEN %s AND %s",
+            (start, end)
+        )
+        return [r[0] for r in self.cursor.fetchall()]
+
+    def count_calendar_days(self, start, end):
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM calendar WHERE date BETWEEN %s AND %s", (start, end)
+        )
+        return self.cursor.fetchone()[0]
+
+    def insert_stock_if_absent(self, code, name, stock_type, category):
+        self.cursor.execute("""
+            IF NOT EXISTS (SELECT 1 FROM stock_list WHERE stock_code=%s)
+            BEGIN
+                INSERT INTO stock_list
+                (stock_code, name, type, category, isTaiwan50)
+                VALUES (%s,%s,%s,%s,0)
+            END
+        """, (code, code, name, stock_type, category))
+        return self.cursor.rowcount > 0
+
+    def upsert_stock(self, code, name, stock_type, category, is_taiwan50):
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM dbo.stock_list WHERE stock_code = %s", (code,)
+        )
+        if self.cursor.fetchone()[0] > 0:
+            self.cursor.execute("""
+            UPDATE dbo.stock_list
+            SET name = %s,
+                type = %s,
+                category = %s,
+                isTaiwan50 = %s
+            WHERE stock_code = %s
+            """, (name, stock_type, category, is_taiwan50, code))
+            return "update"
+
+        self.cursor.execute("""
+        INSERT INTO dbo.stock_list (stock_code, name, type, category, isTaiwan50)
+        VALUES (%s, %s, %s, %s, %s)
+        """, (code, name, stock_type, category, is_taiwan50))
+        return "insert"
+
+    def write_stock_data(self, rows):
+        # 回傳真的有新增的筆數：已存在被 IF NOT EXISTS 跳過的不算
+        inserted = 0
+        for r in rows:
+            # WHERE 用的 stock_code, date, time 放前面，後面接完整欄位
+            # time 可能是 NULL，比對方式與 bulk_load_stock_data 的合併相同
+            self.cursor.execute("""
+            IF NOT EXISTS (
+                SELECT 1 FROM stock_data
+                WHERE stock_code=%s AND date=%s
+                  AND (time=%s OR (time IS NULL AND %s IS NULL))
+            )
+            INSERT INTO stock_data
+            (stock_code, date, time, tv, t, o, h, l, c, d, v)
+            VALUES
+            (%s, %s, %s, %s,%s,%s,%s,%s,%s,%s,%s)
+            """, (r[0], r[1], r[2], r[2]) + tuple(r))
+            inserted += max(self.cursor.rowcount, 0)
+
+        return inserted
+
+    def write_quarantine(self, rows):
+        rows = list(rows)
+        if not rows:
+            return 0
+
+        # 第一次用時自動建表
+        self.cursor.execute("""
+        IF OBJECT_ID('dbo.stock_data_quarantine', 'U') IS NULL
+        BEGIN
+            CREATE TABLE dbo.stock_data_quarantine (
+                id          INT IDENTITY(1,1) PRIMARY KEY,
+                stock_code  VARCHAR(10)   NOT NULL,
+                date        DATE          NULL,
+                raw         NVARCHAR(400) NOT NULL,
+                reason_code INT           NOT NULL,
+                reason      NVARCHAR(200) NOT NULL,
+                created_at  DATETIME      NOT NULL DEFAULT GETDATE()
+            )
+            CREATE INDEX ix_stock_data_quarantine_key
+                ON dbo.stock_data_quarantine (stock_code, date)
+        END
+        """)
+
+        # 重跑時同一筆壞資料不重複隔離：以 (stock_code, date, raw) 判斷，date 可能是 NULL
+        inserted = 0
+        for stock_code, dt, raw, reason_code, reason in rows:
+            self.cursor.execute("""
+            IF NOT EXISTS (
+                SELECT 1 FROM dbo.stock_data_quarantine
+                WHERE stock_code=%s
+                  AND (date=%s OR (date IS NULL AND %s IS NULL))
+                  AND raw=%s
+            )
+            INSERT INTO dbo.stock_data_quarantine
+            (stock_code, date, raw, reason_code, reason)
+            VALUES (%s,%s,%s,%s,%s)
+            """, (stock_code, dt, dt, raw, stock_code, dt, raw, reason_code, reason))
+            inserted += max(self.cursor.rowcount, 0)
+
+        return inserted
+
+    def bulk_load_stock_data(self, rows, batch_size=BULK_BATCH_SIZE, minimal_logging=False):
+        """
+        bulk copy → staging → 去重合併
+
+        minimal_logging：bcp 與合併都加 TABLOCK，
+                         資料庫復原模式為 SIMPLE / BULK_LOGGED 時才會真的變成最少記錄
+        注意：bcp 進行中同一條連線不能再下其他指令，
+              rows 的 generator 裡不要再用這個 storage 查詢或寫入
+        """
+        columns = ", ".join(STOCK_COLUMNS)
+
+        # 欄位型別直接照抄 stock_data，bulk copy 才不會轉型失敗
+        # 暫存表跟 bulk_copy 必須在同一條連線上建立
+        self.cursor.execute(f"""
+        IF OBJECT_ID('tempdb..{self.STAGING_TABLE}', 'U') IS NULL
+            SELECT TOP 0 {columns}
+            INTO {self.STAGING_TABLE}
+            FROM stock_data
+        """)
+        self.cursor.execute(f"TRUNCATE TABLE {self.STAGING_TABLE}")
+
+        # pymssql 的 bulk_copy 走 TDS bulk load，不用一筆一筆 INSERT
+        self.conn.bulk_copy(
+            self.STAGING_TABLE,
+            rows,
+            column_ids=list(range(1, len(STOCK_COLUMNS) + 1)),
+            batch_size=batch_size,
+            tablock=minimal_logging
+        )
+
+        # 以 (stock_code, date, time) 去重：staging 內部取一筆，且 stock_data 尚未存在
+        # time 可能是 NULL，比對時要特別處理
+        hint = "WITH (TABLOCK)" if minimal_logging else ""
+        self.cursor.execute(f"""
+        INSERT INTO stock_data {hint}
+        ({columns})
+        SELECT {columns}
+        FROM (
+            SELECT *,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY stock_code, date, time
+                       ORDER BY (SELECT NULL)
+                   ) AS rn
+            FROM {self.STAGING_TABLE}
+        ) s
+        WHERE s.rn = 1
+          AND NOT EXISTS (
+              SELECT 1 FROM stock_data t
+              WHERE t.stock_code = s.stock_code
+                AND t.date = s.date
+                AND (t.time = s.time OR (t.time IS NULL AND s.time IS NULL))
+          )
+        """)
+        merged = self.cursor.rowcount
+
+        self.cursor.execute(f"TRUNCATE TABLE {self.STAGING_TABLE}")
+
+        return merged
+
+
+# ===============================
+# 內嵌引擎共用部分（SQLite / DuckDB 都吃 ? 參數與標準 SQL）
+# ===============================
+class EmbeddedStorage(StockStorage):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS calendar (
+        date         DATE PRIMARY KEY,
+        day_of_stock INTEGER NOT NULL,
+        other        VARCHAR
+    );
+    CREATE TABLE IF NOT EXISTS year_calendar (
+        year      INTEGER PRIMARY KEY,
+        total_day INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS stock_list (
+        stock_code VARCHAR PRIMARY KEY,
+        name       VARCHAR,
+        type       VARCHAR,
+        category   VARCHAR,
+        isTaiwan50 INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stock_data (
+        stock_code VARCHAR NOT NULL,
+        date       DATE    NOT NULL,
+        time       TIME,
+        tv BIGINT, t BIGINT,
+        o DOUBLE, h DOUBLE, l DOUBLE, c DOUBLE, d DOUBLE,
+        v BIGINT
+    );
+    -- 合併時的 NOT EXISTS 靠這個索引，不然每筆都要掃整張表
+    -- 不用 UNIQUE + ON CONFLICT：日資料 time 是 NULL，唯一索引不會把 NULL 當成重複
+    CREATE INDEX IF NOT EXISTS ix_stock_data_key
+        ON stock_data (stock_code, date, time);
+    CREATE TABLE IF NOT EXISTS stock_data_quarantine (
+        stock_code  VARCHAR NOT NULL,
+        date        DATE,
+        raw         VARCHAR NOT NULL,
+        reason_code INTEGER NOT NULL,
+        reason      VARCHAR NOT NULL,
+        created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS ix_stock_data_quarantine_key
+        ON stock_data_quarantine (stock_code, date);
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = self._open_cursor(conn)
+        # 建表是開啟連線的一部分，不算寫入操作，直接 commit
+        for stmt in self.SCHEMA.split(";"):
+            if stmt.strip():
+                self.cursor.execute(stmt)
+        self.conn.commit()
+
+    def replace_calendar(self, year, days, total_day):
+        # 不用 YEAR(date)：兩邊日期函式不同，改成區間
+        self.cursor.execute(
+            "DELETE FROM calendar WHERE date BETWEEN ? AND ?",
+            (date(year, 1, 1), date(year, 12, 31))
+        )
+        self.cursor.execute("DELETE FROM year_calendar WHERE year=?", (year,))
+
+        self.cursor.executemany(
+            "INSERT INTO calendar (date, day_of_stock, other) VALUES (?,?,?)",
+            list(days)
+        )
+        self.cursor.execute(
+            "INSERT INTO year_calendar (year, total_day) VALUES (?,?)",
+            (year, total_day)
+        )
+
+    def load_non_trading_days(self, start, end):
+        self.cursor.execute(
+            "SELECT date FROM calendar WHERE day_of_stock = -1 AND date BETWEEN ? AND ?",
+            (start, end)
+        )
+        return [r[0] for r in self.cursor.fetchall()]
+
+    def count_calendar_days(self, start, end):
+        self.cursor.execute(
+            "SELECT COUNT(*) FROM calendar WHERE date BETWEEN ? AND ?", (start, end)
+        )
+        return self.cursor.fetchone()[0]
+
+    def _stock_exists(self, code):
+        self.cursor.execute("SELECT COUNT(*) FROM stock_list WHERE stock_code = ?", (code,))
+        return self.cursor.fetchone()[0] > 0
+
+    def insert_stock_if_absent(self, code, name, stock_type, category):
+        if self._stock_exists(code):
+            return False
+
+        self.cursor.execute("""
+            INSERT INTO stock_list (stock_code, name, type, category, isTaiwan50)
+            VALUES (?,?,?,?,0)
+        """, (code, name, stock_type, category))
+        return True
+
+    def upsert_stock(self, code, name, stock_type, category, is_taiwan50):
+        if self._stock_exists(code):
+            self.cursor.execute("""
+            UPDATE stock_list
+            SET name = ?, type = ?, category = ?, isTaiwan50 = ?
+            WHERE stock_code = ?
+            """, (name, stock_type, category, is_taiwan50, code))
+            return "update"
+
+        self.cursor.execute("""
+        INSERT INTO stock_list (stock_code, name, type, category, isTaiwan50)
+        VALUES (?, ?, ?, ?, ?)
+        """, (code, name, stock_type, category, is_taiwan50))
+        return "insert"
+
+    def write_stock_data(self, rows):
+        # 內嵌引擎沒有網路來回，一般寫入也直接走 staging 合併
+        return self.bulk_load_stock_data(rows)
+
+    def write_quarantine(self, rows):
+        # 重跑時同一筆壞資料不重複隔離：以 (stock_code, date, raw) 判斷，date 可能是 NULL
+        inserted = 0
+        for stock_code, dt, raw, reason_code, reason in rows:
+            self.cursor.execute(f"""
+            INSERT INTO stock_data_quarantine ({", ".join(QUARANTINE_COLUMNS)})
+            SELECT ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM stock_data_quarantine
+                WHERE stock_code = ?
+                  AND (date = ? OR (date IS NULL AND ? IS NULL))
+                  AND raw = ?
+            )
+            """, (stock_code, dt, raw, reason_code, reason, stock_code, dt, dt, raw))
+            inserted += self._merged_count()
+        return inserted
+
+    def _open_cursor(self, conn):
+        return conn.cursor()
+
+    def _merged_count(self):
+        return self.cursor.rowcount
+
+    def _stage_chunk(self, chunk):
+        # SQLite：executemany 本身就在同一個行程內，一列一列送就夠快
+        columns = ", ".join(STOCK_COLUMNS)
+        marks = ",".join("?" * len(STOCK_COLUMNS))
+        self.cursor.executemany(
+            f"INSERT INTO stock_data_staging ({columns}) VALUES ({marks})", chunk
+        )
+
+    def bulk_load_stock_data(self, rows, batch_size=BULK_BATCH_SIZE, minimal_logging=False):
+        """
+        staging 暫存表 → 去重合併（與 SQL Server 相同的集合式做法）
+        minimal_logging 只對 SQL Server 有意義，這裡忽略
+        """
+        columns = ", ".join(STOCK_COLUMNS)
+
+        self.cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS stock_data_staging AS
+        SELECT {columns} FROM stock_data LIMIT 0
+        """)
+        self.cursor.execute("DELETE FROM stock_data_staging")
+
+        # 分段送出，generator 不會整個展開在記憶體
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            self._stage_chunk(chunk)
+
+        self.cursor.execute(f"""
+        INSERT INTO stock_data ({columns})
+        SELECT {columns}
+        FROM (
+            SELECT *,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY stock_code, date, time
+                       ORDER BY stock_code
+                   ) AS rn
+            FROM stock_data_staging
+        ) s
+        WHERE s.rn = 1
+          AND NOT EXISTS (
+              SELECT 1 FROM stock_data t
+              WHERE t.stock_code = s.stock_code
+                AND t.date = s.date
+                AND (t.time = s.time OR (t.time IS NULL AND s.time IS NULL))
+          )
+        """)
+        merged = self._merged_count()
+
+        self.cursor.execute("DELETE FROM stock_data_staging")
+
+        return merged
+
+
+# ===============================
+# SQLite（標準函式庫內建）
+# ===============================
+class SQLiteStorage(EmbeddedStorage):
+    def __init__(self, path=":memory:"):
+        super().__init__(sqlite3.connect(path))
+
+
+# ===============================
+# DuckDB（欄式儲存，適合整段區間掃描）
+# ===============================
+class DuckDBStorage(EmbeddedStorage):
+    def __init__(self, path=":memory:"):
+        # 只有真的用 DuckDB 才需要安裝
+        import duckdb
+        super().__init__(duckdb.connect(path))
+
+        # DuckDB 預設每句自動 commit，要自己開交易，
+        # 才符合「方法內部不 commit，一律由呼叫端 commit()」
+        self.conn.begin()
+
+    def _open_cursor(self, conn):
+        # DuckDB 的 conn.cursor() 會另開一條（自動 commit 的）連線，
+        # conn.commit() 管不到它，所以直接在 conn 上執行
+        return conn
+
+    def commit(self):
+        self.conn.commit()
+        self.conn.begin()
+
+    def _merged_count(self):
+        # DuckDB 的 INSERT 會回傳一列「新增筆數」，rowcount 固定是 -1
+        return self.cursor.fetchone()[0]
+
+    def _stage_chunk(self, chunk):
+        # DuckDB 的 executemany 每列都是一次獨立查詢（約 600 列/秒），
+        # 改成把整段轉成 numpy 欄位陣列註冊成表，一次欄式掃進 staging
+        import numpy as np
+
+        cols = list(zip(*chunk))
+        frame = {
+            # 字串用定長 unicode 陣列：object 陣列 DuckDB 會逐個 Python 物件檢查，很慢
+            "stock_code": np.array(cols[0], dtype=str),
+            # DuckDB 不認得 datetime64[D]，用秒為單位再轉回 DATE
+            "date": np.array(cols[1], dtype="datetime64[D]").astype("datetime64[s]"),
+            # None 不能放進 unicode 陣列，NULL 先用空字串代替
+            "time": np.array(["" if t is None else str(t) for t in cols[2]], dtype=str),
+            "tv": np.array(cols[3], dtype=np.int64),
+            "t": np.array(cols[4], dtype=np.int64),
+            "o": np.array(cols[5], dtype=np.float64),
+            "h": np.array(cols[6], dtype=np.float64),
+            "l": np.array(cols[7], dtype=np.float64),
+            "c": np.array(cols[8], dtype=np.float64),
+            "d": np.array(cols[9], dtype=np.float64),
+            "v": np.array(cols[10], dtype=np.int64),
+        }
+
+        self.cursor.register("stock_data_chunk", frame)
+        try:
+            self.cursor.execute(f"""
+            INSERT INTO stock_data_staging ({", ".join(STOCK_COLUMNS)})
+            SELECT CAST(stock_code AS VARCHAR), CAST(date AS DATE),
+                   CAST(NULLIF(CAST(time AS VARCHAR), '') AS TIME),
+                   tv, t, o, h, l, c, d, v
+            FROM stock_data_chunk
+            """)
+        finally:
+            self.cursor.unregister("stock_data_chunk")
+
+
+# ===============================
+# 依設定字串開啟儲存層
+#   "mssql"                → SQL Server（MSSQL_SETTINGS）
+#   "sqlite:stock.db"      → SQLite 檔案
+#   "duckdb:stock.duckdb"  → DuckDB 檔案
+#   "sqlite" / "duckdb"    → 記憶體資料庫（測試用）
+# ===============================
+def open_storage(url=None):
+    # 每次開啟時才讀環境變數，測試 / 腳本中途改 STOCK_DB 也會生效
+    url = url or os.environ.get("STOCK_DB", DEFAULT_DB)
+    kind, _, path = url.partition(":")
+
+    if kind == "mssql":
+        return MSSQLStorage()
+    if kind == "sqlite":
+        return SQLiteStorage(path or ":memory:")
+    if kind == "duckdb":
+        return DuckDBStorage(path or ":memory:")
+
+    raise ValueError(f"不支援的資料庫設定：{url}")
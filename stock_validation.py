@@ -0,0 +1,127 @@
+# ===============================
+# stock_data 驗證：把 STOCK_DAY 原始列轉成欄位陣列，整批檢查
+#
+# Why：一筆一筆用 Python 檢查跟不上全市場回補的速度
+# How：numpy 向量化運算，一次算出整批每一列的 reason bitmask
+# ===============================
+from datetime import date
+
+import numpy as np
+
+
+# ===============================
+# 驗證規則
+# ===============================
+# 每個原因佔一個 bit，一筆資料可以同時違反多條規則
+REASON_BAD_VALUE   = 1    # 欄位無法解析（例如 "--"）
+REASON_HIGH_LT_LOW = 2    # h < l
+REASON_CLOSE_RANGE = 4    # c 不在 [l, h] 之間
+REASON_PRICE_LIMIT = 8    # 漲跌幅超過 ±10%
+REASON_ZERO_VOLUME = 16   # 成交量為 0
+REASON_NON_TRADING = 32   # calendar 標記為非交易日（day_of_stock = -1）
+
+REASON_NAMES = {
+    REASON_BAD_VALUE:   "BAD_VALUE",
+    REASON_HIGH_LT_LOW: "HIGH_LT_LOW",
+    REASON_CLOSE_RANGE: "CLOSE_RANGE",
+    REASON_PRICE_LIMIT: "PRICE_LIMIT",
+    REASON_ZERO_VOLUME: "ZERO_VOLUME",
+    REASON_NON_TRADING: "NON_TRADING",
+}
+
+PRICE_LIMIT = 0.10        # 台股每日漲跌幅限制
+PRICE_EPS   = 1e-6        # 浮點誤差容忍
+
+# STOCK_DAY 每列的欄位順序：日期, tv, t, o, h, l, c, d, v
+STOCK_FIELDS = ("tv", "t", "o", "h", "l", "c", "d", "v")
+
+
+# ===============================
+# 安全解析 TWSE 數字欄位
+# ===============================
+def parse_twse_number(s):
+    # TWSE 常見怪值："1,234"、"+5.00"、"X0.00"（除權息）、"--"（無成交）
+    try:
+        return float(str(s).replace(",", "").lstrip("X+"))
+    except ValueError:
+        # 無法解析就給 NaN，交給驗證階段標記
+        return np.nan
+
+
+# ===============================
+# 安全解析民國日期（115/01/05 → 2026-01-05）
+# ===============================
+def parse_roc_date(s):
+    # 要先加 1911 再建 date：民國 113 年不是閏年，2024 年才是
+    # 先當西元解析的話 113/02/29 會被判成非法日期
+    try:
+        y, m, d = str(s).strip().split("/")
+        return date(int(y) + 1911, int(m), int(d))
+    except ValueError:
+        # 格式不對 / 日期不存在都視為非法，驗證階段會標成 BAD_VALUE
+        return None
+
+
+# ===============================
+# 把 STOCK_DAY 原始列轉成「欄位陣列」
+# ===============================
+def parse_stock_rows(rows):
+    rows = list(rows)
+
+    batch = {
+        "raw": rows,
+        "date": np.array([parse_roc_date(r[0]) if r else None for r in rows],
+                         dtype="datetime64[D]"),
+    }
+    for i, name in enumerate(STOCK_FIELDS, start=1):
+        batch[name] = np.array(
+            [parse_twse_number(r[i]) if len(r) > i else np.nan for r in rows],
+            dtype=np.float64
+        )
+    return batch
+
+
+# ===============================
+# 整批驗證：回傳每一列的 reason bitmask（0 = 乾淨）
+# ===============================
+def validate_stock_batch(batch, non_trading_days):
+    tv, o, h, l, c, d, v = (batch[k] for k in ("tv", "o", "h", "l", "c", "d", "v"))
+    reasons = np.zeros(len(c), dtype=np.int64)
+
+    # 任何欄位是 NaN / 日期是 NaT
+    values = np.column_stack([batch[k] for k in STOCK_FIELDS])
+    reasons[np.isnan(values).any(axis=1) | np.isnat(batch["date"])] |= REASON_BAD_VALUE
+
+    # 價格區間：NaN 比較結果為 False，不會重複標記
+    reasons[h < l] |= REASON_HIGH_LT_LOW
+    reasons[(c < l - PRICE_EPS) | (c > h + PRICE_EPS)] |= REASON_CLOSE_RANGE
+
+    # 漲跌幅：參考價 = 收盤 - 漲跌價差（除權息日也適用）
+    ref = c - d
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = np.abs(d) / ref
+    reasons[(ref > 0) & (move > PRICE_LIMIT + PRICE_EPS)] |= REASON_PRICE_LIMIT
+
+    # 交易日卻沒有成交
+    reasons[(tv == 0) | (v == 0)] |= REASON_ZERO_VOLUME
+
+    # calendar 說今天休市
+    reasons[np.isin(batch["date"], non_trading_days)] |= REASON_NON_TRADING
+
+    return reasons
+
+
+# ===============================
+# reason bitmask → 可讀字串（例如 "HIGH_LT_LOW,CLOSE_RANGE"）
+# ===============================
+def describe_reasons(code):
+    return ",".join(name for bit, name in REASON_NAMES.items() if code & bit)
+
+
+# ===============================
+# 依 mask 切出子批次
+# ===============================
+def take_batch(batch, mask):
+    out = {k: v[mask] for k, v in batch.items() if k != "raw"}
+    out["raw"] = [r for r, keep in zip(batch["raw"], mask) if keep]
+    return out
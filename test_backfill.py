@@ -0,0 +1,143 @@
+import importlib.util
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+# 回補流程在 0224_calendar_pipeline.py 裡（檔名是數字開頭，只能用路徑載入）
+for dep in ("numpy", "requests", "bs4", "selenium", "webdriver_manager"):
+    pytest.importorskip(dep)
+
+spec = importlib.util.spec_from_file_location(
+    "calendar_pipeline", Path(__file__).with_name("0224_calendar_pipeline.py")
+)
+pipeline = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(pipeline)
+
+from stock_storage import open_storage
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    url = f"sqlite:{tmp_path / 'stock.db'}"
+    monkeypatch.setenv("STOCK_DB", url)
+    monkeypatch.setattr(pipeline, "BACKFILL_SLEEP", 0)
+
+    # 2016 整年 calendar：週末休市
+    days = []
+    d = date(2016, 1, 1)
+    while d.year == 2016:
+        days.append((d, -1 if d.weekday() >= 5 else 1, ""))
+        d += timedelta(days=1)
+    st = open_storage()
+    st.replace_calendar(2016, days, 0)
+    st.commit()
+    st.close()
+
+    return url
+
+
+def month_rows(y, m):
+    # 前三個平日是乾淨的，第一個週六會被 NON_TRADING 隔離
+    d = date(y, m, 1)
+    weekdays, saturday = [], None
+    while len(weekdays) < 3 or saturday is None:
+        if d.weekday() < 5 and len(weekdays) < 3:
+            weekdays.append(d)
+        elif d.weekday() == 5 and saturday is None:
+            saturday = d
+        d += timedelta(days=1)
+
+    return [
+        [f"{dt.year - 1911}/{dt.month:02d}/{dt.day:02d}",
+         "1,000", "100", "100", "105", "99", "104", "+4.00", "10"]
+        for dt in weekdays + [saturday]
+    ]
+
+
+def fake_fetch(stock_no, query_date):
+    y, m = int(query_date[:4]), int(query_date[4:6])
+    if m == 3:
+        return None                               # 重試後仍失敗的月份
+    if m == 5:
+        return {"data": month_rows(y, 4)}         # 跟 4 月完全重複
+    return {"data": month_rows(y, m)}
+
+
+def count(table):
+    st = open_storage()
+    st.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    n = st.cursor.fetchone()[0]
+    st.close()
+    return n
+
+
+def test_backfill_counts_and_rerun(db, monkeypatch):
+    monkeypatch.setattr(pipeline, "fetch_stock_day", fake_fetch)
+
+    # batch_size 小於一檔一年的量，段落中途與每檔結束都會寫入
+    merged, quarantined, failed = pipeline.backfill_stock_data(
+        ["2330", "2317"], 2016, 2016, batch_size=6
+    )
+
+    # 每檔：12 個月 - 失敗的 3 月 - 重複的 5 月 = 10 個月，每月 3 筆乾淨 + 1 筆週六
+    assert (merged, quarantined) == (60, 20)
+    assert failed == ["2330 2016-03", "2317 2016-03"]
+    assert count("stock_data") == 60
+    assert count("stock_data_quarantine") == 20
+
+    # 重跑不會多寫
+    merged, quarantined, failed = pipeline.backfill_stock_data(
+        ["2330", "2317"], 2016, 2016, batch_size=6
+    )
+    assert (merged, quarantined) == (0, 0)
+    assert count("stock_data") == 60
+
+
+def test_backfill_keeps_flushed_chunks_on_crash(db, monkeypatch):
+    def crashing_fetch(stock_no, query_date):
+        if stock_no == "2317" and query_date == "20160701":
+            raise RuntimeError("boom")
+        return fake_fetch(stock_no, query_date)
+
+    monkeypatch.setattr(pipeline, "fetch_stock_day", crashing_fetch)
+
+    with pytest.raises(RuntimeError):
+        pipeline.backfill_stock_data(["2330", "2317"], 2016, 2016, batch_size=6)
+
+    # 2330 整檔結束時已寫入（30 筆）；
+    # 2317 在 2 月、5 月累積到 6 筆時各寫入一次（1、2、4 月共 9 筆），6 月還沒寫入就中斷
+    assert count("stock_data") == 39
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("被擋的 HTML 頁面")
+        return self.body
+
+
+def test_fetch_retries_then_gives_up(monkeypatch):
+    monkeypatch.setattr(pipeline, "BACKFILL_SLEEP", 0)
+    calls = []
+
+    def flaky_get(url, params, timeout):
+        calls.append(params["date"])
+        if len(calls) == 1:
+            raise pipeline.requests.Timeout("timeout")
+        if len(calls) == 2:
+            return FakeResponse(None)
+        return FakeResponse({"data": []})
+
+    monkeypatch.setattr(pipeline.requests, "get", flaky_get)
+    assert pipeline.fetch_stock_day("2330", "20160101") == {"data": []}
+    assert len(calls) == 3
+
+    monkeypatch.setattr(pipeline.requests, "get", lambda *a, **k: FakeResponse(None))
+    assert pipeline.fetch_stock_day("2330", "20160101") is None
@@ -0,0 +1,90 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from stock_storage import open_storage
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def db_url(request, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    return f"{request.param}:{tmp_path / 'stock.db'}"
+
+
+@pytest.fixture
+def storage(db_url):
+    st = open_storage(db_url)
+    yield st
+    st.close()
+
+
+def bar(day, t=None, code="2330"):
+    return (code, date(2026, 1, day), t, 1000, 100, 100.0, 105.0, 99.0, 104.0, 4.0, 10)
+
+
+def count(storage, table):
+    storage.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return storage.cursor.fetchone()[0]
+
+
+def test_calendar(storage):
+    days = []
+    d = date(2026, 1, 1)
+    while d.year == 2026:
+        days.append((d, -1 if d.weekday() >= 5 else 1, ""))
+        d += timedelta(days=1)
+
+    # 重跑同一年要整年覆蓋，不會重複
+    storage.replace_calendar(2026, days, 261)
+    storage.replace_calendar(2026, days, 261)
+
+    assert storage.count_calendar_days(date(2026, 1, 1), date(2026, 12, 31)) == 365
+    assert storage.count_calendar_days(date(2025, 12, 1), date(2025, 12, 31)) == 0
+
+    # SQLite 回傳字串、DuckDB 回傳 date，統一轉成 ISO 字串比較
+    jan = storage.load_non_trading_days(date(2026, 1, 1), date(2026, 1, 11))
+    assert sorted(str(d) for d in jan) == ["2026-01-03", "2026-01-04", "2026-01-10", "2026-01-11"]
+
+
+def test_stock_data_dedupe(storage):
+    # 同一批內重複、非 NULL time 與 NULL time 是不同的 key
+    rows = [bar(5), bar(5), bar(5, time(9, 0)), bar(6)]
+    assert storage.bulk_load_stock_data(rows) == 3
+    assert storage.bulk_load_stock_data(rows) == 0
+
+    assert storage.write_stock_data([bar(5, time(9, 0)), bar(6), bar(7)]) == 1
+    assert storage.write_stock_data([bar(7)]) == 0
+
+    assert count(storage, "stock_data") == 4
+
+
+def test_quarantine_idempotent(storage):
+    rows = [
+        ("2330", None, "bad", 1, "BAD_VALUE"),
+        ("2330", date(2026, 1, 6), "115/01/06|...", 6, "HIGH_LT_LOW,CLOSE_RANGE"),
+    ]
+    assert storage.write_quarantine(rows) == 2
+    assert storage.write_quarantine(rows) == 0
+    assert count(storage, "stock_data_quarantine") == 2
+
+
+def test_nothing_persists_without_commit(db_url):
+    st = open_storage(db_url)
+    st.replace_calendar(2026, [(date(2026, 1, 1), -1, "")], 0)
+    st.bulk_load_stock_data([bar(5)])
+    st.write_quarantine([("2330", None, "bad", 1, "BAD_VALUE")])
+    st.close()
+
+    st = open_storage(db_url)
+    assert count(st, "calendar") == 0
+    assert count(st, "stock_data") == 0
+    assert count(st, "stock_data_quarantine") == 0
+
+    st.bulk_load_stock_data([bar(5)])
+    st.commit()
+    st.close()
+
+    st = open_storage(db_url)
+    assert count(st, "stock_data") == 1
+    st.close()
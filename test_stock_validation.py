@@ -0,0 +1,49 @@
+from datetime import date
+
+import numpy as np
+
+from stock_validation import (
+    REASON_BAD_VALUE, REASON_NON_TRADING,
+    parse_roc_date, parse_stock_rows, validate_stock_batch, describe_reasons
+)
+
+NO_HOLIDAYS = np.array([], dtype="datetime64[D]")
+
+
+def bar(day):
+    return [day, "1,000", "100", "100", "105", "99", "104", "+4.00", "10"]
+
+
+def test_roc_leap_day():
+    # 民國 113 年當西元看不是閏年，但 2024-02-29 是交易日
+    assert parse_roc_date("113/02/29") == date(2024, 2, 29)
+    assert parse_roc_date("105/02/29") == date(2016, 2, 29)
+    assert parse_roc_date("114/02/29") is None
+
+    batch = parse_stock_rows([bar("113/02/29"), bar("105/02/29")])
+    assert not np.isnat(batch["date"]).any()
+    assert (validate_stock_batch(batch, NO_HOLIDAYS) == 0).all()
+
+
+def test_bad_rows_get_reasons():
+    rows = [
+        bar("115/01/05"),
+        ["115/01/06", "1,000", "100", "100", "99", "105", "104", "+0.00", "10"],
+        ["115/01/07", "0", "0", "--", "--", "--", "--", "0.00", "0"],
+        ["115/01/08", "1,000", "100", "100", "120", "99", "115", "+15.00", "10"],
+        bar("115/01/10"),
+        bar("115/02/30"),
+    ]
+    batch = parse_stock_rows(rows)
+    reasons = validate_stock_batch(batch, np.array(["2026-01-10"], dtype="datetime64[D]"))
+
+    assert [describe_reasons(r) for r in reasons] == [
+        "",
+        "HIGH_LT_LOW,CLOSE_RANGE",
+        "BAD_VALUE,ZERO_VOLUME",
+        "PRICE_LIMIT",
+        "NON_TRADING",
+        "BAD_VALUE",
+    ]
+    assert reasons[4] == REASON_NON_TRADING
+    assert reasons[5] == REASON_BAD_VALUE